@@ -31,6 +31,8 @@ class GlobalSettings(BaseSettings):
     db_file_path: str = Field(default="", env="LIBMM_DB_FILEPATH")
     db_text_delimiter: str = Field(default="||", env="LIBMM_DB_DELIMETER")
     db_file_autodelete: bool = Field(default=True, env="LIBMM_DB_AUTODELETE")
+    db_fast_pragmas: bool = Field(default=True, env="LIBMM_DB_FAST_PRAGMAS")
+    parallel_ingest: bool = Field(default=False, env="LIBMM_PARALLEL_INGEST")
     experimental_features: bool = Field(default=False, env="LIBMM_EXPERIMENTAL_FEATURES")
 
 
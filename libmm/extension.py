@@ -6,7 +6,7 @@ import atexit
 import os
 
 from .utils import resolve_str_or_path
-from .type import StrOrPath, Enum, auto, List, TypeVar, Any
+from .type import StrOrPath, Enum, auto, List, TypeVar, Any, Optional, Set
 from .config import global_settings
 from .log import logger
 
@@ -156,6 +156,14 @@ class AbstractUserHook(ABC):
     def settings(self) -> List["UserHookSetting"]:
         return []
 
+    @property
+    def events(self) -> Optional[List[EventTypes]]:
+        """
+        Event types the hook should be called for
+        Defaults to None, meaning the hook is called for all events
+        """
+        return None
+
     @abstractmethod
     def hook(self, event_type: EventTypes, context):
         pass
@@ -275,10 +283,15 @@ class ExtensionsManager:
     def __init__(self):
         self.enabled = not global_settings.disable_extensions
         self.__extensions = []
+        # event types that at least one extension listens for
+        self.__listened_events: Set[EventTypes] = set()
 
         if self.enabled:
             hooks = load_hooks_from_disk()
             self.__extensions.extend(hooks)
+            for extension in hooks:
+                events = extension.hook.events
+                self.__listened_events.update(EventTypes if events is None else events)
             self.process_env_vars()
             self.emit_event(event=EventPairs.Init)
 
@@ -319,15 +332,22 @@ class ExtensionsManager:
     def register_extension(self):
         return NotImplementedError
 
+    def has_listeners(self, event: EventPair) -> bool:
+        """
+        Whether any extension listens for the event
+        Can be used to skip building an event's context on hot paths
+        """
+        return self.enabled and event.event_type in self.__listened_events
+
     def emit_event(self, event: EventPair, *args, **kwargs):
         """
-        All extensions are passed all events without filtering
+        Extensions are passed the events listed in their `events` or all events if they do not list any
         Args/kwargs are passed into the context object of the event
-        TODO: in the future, possibly allow extension to register only for specific events
         """
-        if self.enabled:
+        if self.has_listeners(event):
             for extension in self.extensions:
-                extension.hook.hook(event.event_type, event.context(*args, **kwargs))
+                if (events := extension.hook.events) is None or event.event_type in events:
+                    extension.hook.hook(event.event_type, event.context(*args, **kwargs))
 
     def match_setting_by_cli_arg(self, arg):
         for extension in self.extensions:
@@ -32,6 +32,10 @@ class GraphvizHook(AbstractUserHook):
     def name(self):
         return "graphviz"
 
+    @property
+    def events(self):
+        return [EventTypes.CliStart, EventTypes.CliExit, EventTypes.BlueprintLoaded]
+
     @property
     def settings(self):
         return list(self.__settings.values())
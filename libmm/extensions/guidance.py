@@ -310,6 +310,16 @@ class GuidanceHook(AbstractUserHook):
     def name(self):
         return "guidance"
 
+    @property
+    def events(self):
+        return [
+            EventTypes.CliStart,
+            EventTypes.DbReady,
+            EventTypes.LinkTableReady,
+            EventTypes.CliExit,
+            EventTypes.BlueprintLoaded,
+        ]
+
     @property
     def settings(self):
         return list(self.__settings.values())
@@ -40,6 +40,10 @@ class PartialsHook(AbstractUserHook):
     def name(self):
         return "partials"
 
+    @property
+    def events(self):
+        return [EventTypes.DbReady]
+
     @property
     def settings(self):
         return list(self.__settings.values())
@@ -77,6 +77,10 @@ class SigmaHook(AbstractUserHook):
     def name(self):
         return "sigma"
 
+    @property
+    def events(self):
+        return [EventTypes.CliStart, EventTypes.LinkTableReady, EventTypes.CliExit, EventTypes.BlueprintLoaded]
+
     @property
     def settings(self):
         return list(self.__settings.values())
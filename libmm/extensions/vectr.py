@@ -15,6 +15,10 @@ class VectrHook(AbstractUserHook):
     def name(self):
         return "vectr"
 
+    @property
+    def events(self):
+        return [EventTypes.TestCaseRender]
+
     @property
     def settings(self):
         return []
@@ -39,6 +39,24 @@ def get_cti_store() -> MemoryStore:
     return src
 
 
+@lru_cache(maxsize=None)
+def get_technique_index() -> dict:
+    """
+    return a mapping of external ID -> attack patterns
+    built with a single store query so per-TID lookups avoid rescanning the CTI data
+    """
+    results = get_cti_store().query(
+        [Filter("type", "=", "attack-pattern"), Filter("external_references.source_name", "=", "mitre-attack")]
+    )
+    index = {}
+    for result in results:  # type: dict
+        # index every external ID to match the behavior of filtering on external_references.external_id
+        for external_id in {reference.get("external_id") for reference in result.external_references}:
+            if external_id:
+                index.setdefault(external_id, []).append(result)
+    return index
+
+
 @lru_cache(maxsize=None)
 def get_mitre_tactic_id_map() -> dict:
     """return a mapping of tactic name -> tactic id"""
@@ -132,6 +150,19 @@ def get_d3fend_ctrm_for_artifact(artifact: str) -> Set[str]:
     return set(ctrms)
 
 
+@lru_cache(maxsize=None)
+def get_d3fend_details_for_tid(tid: str) -> tuple:
+    """
+    given an ATT&CK tid, return the mapped D3FEND offensive artifacts and their countermeasures
+    as a tuple of (artifact, countermeasures) pairs
+    the result is cached so callers should copy the values before modifying them
+    """
+    return tuple(
+        (artifact, tuple(get_d3fend_ctrm_for_artifact(artifact)))
+        for artifact in get_d3fend_off_artifacts_for_tid(tid=tid)
+    )
+
+
 class LayerColors:
     LEFT = COLORS.BLUE
     RIGHT = COLORS.RED
@@ -1,5 +1,7 @@
 import click
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from libmm.index import gen_blueprint_export, gen_comparison_export, BlueprintExport, ComparisonExport
 from libmm.type import OutputPrefixes
@@ -10,7 +12,7 @@ from libmm.inject import opts_from_extensions
 from libmm.extension import extensions_manager, EventPairs
 from libmm.mitre import get_d3fend_off_artifacts_for_tid
 from libmm.scripts.shared import SharedOptions
-from libmm.sql import init_db, Variant, Blueprint
+from libmm.sql import init_db, session, Variant, Blueprint
 
 # TODO: command to run checks standalone
 
@@ -39,30 +41,52 @@ def generate(techniques, blueprint, output=None, summary=None, navigator=None, s
     init_db(variants_paths=techniques)
     extensions_manager.emit_event(event=EventPairs.CliStart)
 
-    blueprint = Blueprint.from_file(blueprint)
+    blueprint = Blueprint.get_with_variants(Blueprint.from_file(blueprint).id)
 
     click.echo(f"{OutputPrefixes.Neutral} {Variant.count()} variants in library")
     click.echo(f"{OutputPrefixes.Neutral} {len(blueprint.variants)} variants in blueprint")
 
-    if output:
-        manifest = gen_blueprint_export(blueprint, BlueprintExport.Manifest)
-        dump_yaml_to_file(manifest, output)
-        click.echo(f"{OutputPrefixes.Good} Wrote manifest to {output.as_posix()}")
-
-    if navigator:
-        navlayer = gen_blueprint_export(blueprint, BlueprintExport.NavigatorLayer)
-        dump_json_to_file(json_=navlayer, json_file=navigator)
-        click.echo(f"{OutputPrefixes.Good} Wrote navigator layer to {navigator.as_posix()}")
-
+    # exports are generated on the main thread since they share the database session
+    # only the file writes are handed off to the pool
+    writes = []  # list of (write function, message) pairs
+    # exports only read from the database so skip flushing before each query
+    with session.no_autoflush:
+        if output:
+            manifest = gen_blueprint_export(blueprint, BlueprintExport.Manifest)
+            writes.append(
+                (
+                    partial(dump_yaml_to_file, manifest, output),
+                    f"{OutputPrefixes.Good} Wrote manifest to {output.as_posix()}",
+                )
+            )
+
+        if navigator:
+            navlayer = gen_blueprint_export(blueprint, BlueprintExport.NavigatorLayer)
+            writes.append(
+                (
+                    partial(dump_json_to_file, json_=navlayer, json_file=navigator),
+                    f"{OutputPrefixes.Good} Wrote navigator layer to {navigator.as_posix()}",
+                )
+            )
+
+        if summary:
+            csv = gen_blueprint_export(blueprint, BlueprintExport.SummaryCsv)
+            writes.append(
+                (partial(summary.write_text, csv), f"{OutputPrefixes.Good} Wrote summary to {summary.as_posix()}")
+            )
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [(executor.submit(write), message) for write, message in writes]
+        for future, message in futures:
+            future.result()
+            click.echo(message)
+
+    # the sub-library renders and dumps YAML as it goes so it runs after the pool
+    # as neither the session nor the YAML object are safe to share between threads
     if sublibrary:
         gen_blueprint_export(blueprint, BlueprintExport.Sublibrary, root=sublibrary)
         click.echo(f"{OutputPrefixes.Good} Wrote sub-library to {sublibrary.as_posix()}")
 
-    if summary:
-        csv = gen_blueprint_export(blueprint, BlueprintExport.SummaryCsv)
-        summary.write_text(csv)
-        click.echo(f"{OutputPrefixes.Good} Wrote summary to {summary.as_posix()}")
-
     extensions_manager.emit_event(event=EventPairs.CliExit)
 
 
@@ -80,10 +104,10 @@ def compare(techniques, blueprint1, blueprint2, navigator, stats):
     init_db(variants_paths=techniques)
     click.echo(f"{OutputPrefixes.Neutral} {Variant.count()} variants in library")
 
-    blueprint1 = Blueprint.from_file(blueprint1)
+    blueprint1 = Blueprint.get_with_variants(Blueprint.from_file(blueprint1).id)
     click.echo(f"{OutputPrefixes.Neutral} {len(blueprint1.variants)} variants in {blueprint1.name}")
 
-    blueprint2 = Blueprint.from_file(blueprint2)
+    blueprint2 = Blueprint.get_with_variants(Blueprint.from_file(blueprint2).id)
     click.echo(f"{OutputPrefixes.Neutral} {len(blueprint2.variants)} variants in {blueprint2.name}")
 
     if navigator:
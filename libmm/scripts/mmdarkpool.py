@@ -1,20 +1,25 @@
 import click
+import os
 import pathlib
 import jinja2
 import shutil
+import re
+import multiprocessing
 from functools import lru_cache
-import inspect
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from dataclasses import dataclass
 from stix2 import AttackPattern
+from sqlalchemy import select, bindparam, literal_column
 
 from libmm.config import global_settings
 from libmm.log import logger
 from libmm.sql import init_db, Variant, Blueprint, session, LinkedData, LinkedDataFormat, LinkedDataTarget
 from libmm.extension import extensions_manager, EventPairs
-from libmm.utils import load_json_from_file, dump_yaml_to_file, dump_json_to_file
-from libmm.type import List, Tuple, Optional
+from libmm.utils import load_json_from_file, dump_yaml_to_str, dump_json_to_bytes, write_bytes_to_file
+from libmm.type import List, Tuple, Optional, Iterator, StrOrPath
 from libmm.scripts.shared import SharedOptions, validate_multi_directory
 from libmm.index import gen_blueprint_export, BlueprintExport, gen_summary_csv_from_blueprint
-from libmm.mitre import get_cti_store, Filter
+from libmm.mitre import get_technique_index
 
 global_settings.run_checks = False
 
@@ -28,13 +33,8 @@ LatestBlueprintPair = Tuple[str, Blueprint]
 
 
 def lookup_technique_by_tid(tid: str) -> Optional[List[AttackPattern]]:
-    return get_cti_store().query(
-        [
-            Filter("type", "=", "attack-pattern"),  # attack pattern = technique
-            Filter("external_references.source_name", "=", "mitre-attack"),
-            Filter("external_references.external_id", "=", tid),
-        ]
-    )
+    # callers should treat the returned list as read-only as it is shared with the technique index
+    return get_technique_index().get(tid, [])
 
 
 @lru_cache(maxsize=None)
@@ -77,7 +77,8 @@ def resolve_tid_to_name(value: str, parent: bool = True) -> str:
 
 tpl_path = pathlib.Path(__file__).parent / "mmdarkpool" / "templates"
 jinja_loader = jinja2.FileSystemLoader(searchpath=tpl_path)
-jinja_env = jinja2.Environment(loader=jinja_loader)
+# templates are static for the life of the process so skip the per-render staleness checks
+jinja_env = jinja2.Environment(loader=jinja_loader, auto_reload=False, cache_size=-1)
 # add custom filters to template loader
 jinja_env.filters["tid2name"] = resolve_tid_to_name
 
@@ -91,6 +92,23 @@ class Templates:
     Variants = "variants.html.j2"
     Blueprint = "blueprint.html.j2"
     Blueprints = "blueprints.html.j2"
+    Sidebar = "sidebar.html.j2"
+
+
+# resolve the templates once rather than per render
+TPL_VARIANT = jinja_env.get_template(Templates.Variant)
+TPL_VARIANTS = jinja_env.get_template(Templates.Variants)
+TPL_BLUEPRINT = jinja_env.get_template(Templates.Blueprint)
+TPL_BLUEPRINTS = jinja_env.get_template(Templates.Blueprints)
+TPL_SIDEBAR = jinja_env.get_template(Templates.Sidebar)
+# template name -> template for rendering the pages, which only carry the name as the templates are not picklable
+TEMPLATES_BY_NAME = {
+    Templates.Variant: TPL_VARIANT,
+    Templates.Variants: TPL_VARIANTS,
+    Templates.Blueprint: TPL_BLUEPRINT,
+    Templates.Blueprints: TPL_BLUEPRINTS,
+    Templates.Sidebar: TPL_SIDEBAR,
+}
 
 
 # paths have no leading slashes so they dont conflict with pathlib path merging
@@ -106,6 +124,13 @@ class StaticDirectories:
     Addons = "addons"
     Summaries = "summaries"
 
+    # keep in sync with the directories above
+    All = (Variants, Blueprints, Manifests, NavigatorLayers, NavigatorUI, Addons, Summaries)
+
+
+# matches href/src attributes in the navigator index that have not already been relocated
+NAV_INDEX_PATH_RE = re.compile(r'(href|src)="(?!/navigator/)')
+
 
 class SitePaths:
     Blueprints = "bundles.html"
@@ -123,6 +148,16 @@ class SitePaths:
     Summaries = StaticDirectories.Summaries + "/{blueprint_id}.csv"
 
 
+# LinkedData format -> HTML wrapper for the data
+LINKED_DATA_WRAPPERS = {
+    LinkedDataFormat.Plaintext: "<pre>{}</pre>",
+    LinkedDataFormat.Markdown: "<div id='markdown'>{}</div>",
+    LinkedDataFormat.YAML: "<pre><code>{}</code></pre>",
+    LinkedDataFormat.JSON: "<pre><code>{}</code></pre>",
+    LinkedDataFormat.Unformatted: "{}",
+}
+
+
 def format_linked_data(linked_data: LinkedData):
     """
     Given a LinkedData instance, apply HTML formatting based
@@ -130,18 +165,7 @@ def format_linked_data(linked_data: LinkedData):
     Markdown will be rendered client-side
     YAML/JSON will have syntax highlighting applied client-side
     """
-
-    data = linked_data.data
-    if linked_data.data_format == LinkedDataFormat.Plaintext:
-        data = f"<pre>{data}</pre>"
-    elif linked_data.data_format == LinkedDataFormat.Markdown:
-        data = f"<div id='markdown'>{data}</div>"
-    elif linked_data.data_format in [LinkedDataFormat.YAML, LinkedDataFormat.JSON]:
-        data = f"<pre><code>{data}</code><pre>"
-    elif linked_data.data_format == LinkedDataFormat.Unformatted:
-        pass
-
-    return data
+    return LINKED_DATA_WRAPPERS.get(linked_data.data_format, "{}").format(linked_data.data)
 
 
 def render_variant_listing(variants: List[Variant]):
@@ -152,7 +176,7 @@ def render_variant_listing(variants: List[Variant]):
     grouped = {}
     for variant in variants:
         grouped.setdefault(variant.tid, []).append(variant.render())
-    return jinja_env.get_template(Templates.Variants).render(grouped_variants=grouped)
+    return TPL_VARIANTS.render(grouped_variants=grouped)
 
 
 def render_blueprint_listing(latest_blueprints: List[LatestBlueprintPair], all_blueprints: List[Blueprint]):
@@ -161,94 +185,208 @@ def render_blueprint_listing(latest_blueprints: List[LatestBlueprintPair], all_b
     - latest_blueprints
     - all_blueprints
     """
-    return jinja_env.get_template(Templates.Blueprints).render(
-        latest_blueprints=latest_blueprints, all_blueprints=all_blueprints
-    )
+    return TPL_BLUEPRINTS.render(latest_blueprints=latest_blueprints, all_blueprints=all_blueprints)
 
 
-def render_blueprint(
-    latest_blueprints: List[LatestBlueprintPair], all_blueprints: List[Blueprint], blueprint: Blueprint
-):
+# statements for the per-page fallback queries
+#   these are defined once with bind params so SA can reuse the compiled statement for every page
+STMT_BLUEPRINT_LINKED_DATA = select(LinkedData).where(
+    LinkedData.blueprint_id == bindparam("blueprint_id"), LinkedData.target_type == LinkedDataTarget.Blueprint
+)
+STMT_VARIANT_LINKED_DATA = select(LinkedData).where(
+    LinkedData.variant_id == bindparam("variant_id"), LinkedData.target_type == LinkedDataTarget.Variant
+)
+# ordered by rowid to keep the library load order, otherwise sqlite returns the rows in the order of the
+#   (tid, name, version) index it uses for the filter
+STMT_RELATED_VARIANTS = (
+    select(Variant).where(Variant.tid == bindparam("tid")).order_by(literal_column(f"{Variant.__tablename__}.rowid"))
+)
+
+
+def group_linked_data(target_type: LinkedDataTarget) -> dict:
+    """
+    Load all linked data for the given target type in one query and group it
+    by target ID then by display name. Values are the formatted data.
+    e.g. { <variant id>: { <display name>: [ <formatted data>, ... ] } }
+    """
+    grouped = {}
+    for row in session.query(LinkedData).filter(LinkedData.target_type == target_type).all():  # type: LinkedData
+        target_id = row.variant_id if target_type == LinkedDataTarget.Variant else row.blueprint_id
+        grouped.setdefault(target_id, {}).setdefault(row.display_name, []).append(format_linked_data(row))
+    return grouped
+
+
+def render_blueprint_sidebar(latest_blueprints: List[LatestBlueprintPair], all_blueprints: List[Blueprint]):
+    """
+    vars:
+    - latest_blueprints
+    - all_blueprints
+    """
+    return TPL_SIDEBAR.render(latest_blueprints=latest_blueprints, all_blueprints=all_blueprints)
+
+
+@dataclass
+class BlueprintView:
+    """
+    Plain copy of the Blueprint fields used by the templates
+    Pages may be rendered in worker processes so the template context
+    cannot hold database objects
+    """
+
+    id: str
+    name: str
+    description: str
+    variants: List[dict]
+    child_campaigns: List[str]
+    child_groups: List[dict]
+
+    @classmethod
+    def from_blueprint(cls, blueprint: Blueprint) -> "BlueprintView":
+        return cls(
+            id=blueprint.id,
+            name=blueprint.name,
+            description=blueprint.description,
+            variants=[{"id": variant.id, "tid": variant.tid} for variant in blueprint.variants],
+            child_campaigns=[campaign.name for campaign in blueprint.child_campaigns],
+            child_groups=[{"name": group.name} for group in blueprint.child_groups],
+        )
+
+
+def render_blueprint_campaigns(blueprint: Blueprint) -> List[Tuple[str, List[dict]]]:
+    """return (campaign name, rendered variants) pairs for the blueprint, with the blueprint's overrides applied"""
+    return [
+        (
+            campaign.name,
+            [variant.render(apply_overrides=True, blueprint_id=blueprint.id) for variant in campaign.variants],
+        )
+        for campaign in blueprint.child_campaigns
+    ]
+
+
+def blueprint_context(
+    latest_blueprints: List[LatestBlueprintPair],
+    all_blueprints: List[Blueprint],
+    blueprint: Blueprint,
+    linked_data: Optional[dict] = None,
+    sidebar_html: Optional[str] = None,
+    campaigns: Optional[List[Tuple[str, List[dict]]]] = None,
+) -> dict:
     """
     vars:
     - latest_blueprints
     - all_blueprints
     - blueprint
+    other vars
+    - linked_data (if not provided, it is queried for the blueprint)
+    - sidebar_html (if not provided, it is rendered from the latest and all blueprints)
+    - campaigns (if not provided, rendered with render_blueprint_campaigns())
     """
-    linked_data = {}
-    for row in (
-        session.query(LinkedData)
-        .filter(LinkedData.blueprint_id == blueprint.id, LinkedData.target_type == LinkedDataTarget.Blueprint)
-        .all()
-    ):  # type: LinkedData
-        data = format_linked_data(row)
-        linked_data.setdefault(row.display_name, []).append(data)
-
-    campaigns = []  # list of campaign name, variant pairs
-    for campaign in blueprint.child_campaigns:
-        variants = [variant.render(apply_overrides=True, blueprint_id=blueprint.id) for variant in campaign.variants]
-        pair = campaign.name, variants
-        campaigns.append(pair)
-
-    return jinja_env.get_template(Templates.Blueprint).render(
+    # the sidebar is the same for every blueprint page so callers rendering many pages
+    # should render it once and pass it in
+    if sidebar_html is None:
+        sidebar_html = render_blueprint_sidebar(latest_blueprints=latest_blueprints, all_blueprints=all_blueprints)
+
+    if linked_data is None:
+        linked_data = {}
+        for row in session.execute(
+            STMT_BLUEPRINT_LINKED_DATA, {"blueprint_id": blueprint.id}
+        ).scalars():  # type: LinkedData
+            data = format_linked_data(row)
+            linked_data.setdefault(row.display_name, []).append(data)
+
+    if campaigns is None:
+        campaigns = render_blueprint_campaigns(blueprint)
+
+    return dict(
+        sidebar_html=sidebar_html,
+        blueprint=BlueprintView.from_blueprint(blueprint),
+        linked_data=linked_data,
+        campaigns=campaigns,
+    )
+
+
+def render_blueprint(
+    latest_blueprints: List[LatestBlueprintPair],
+    all_blueprints: List[Blueprint],
+    blueprint: Blueprint,
+    linked_data: Optional[dict] = None,
+    sidebar_html: Optional[str] = None,
+    campaigns: Optional[List[Tuple[str, List[dict]]]] = None,
+) -> str:
+    """render the blueprint page; see blueprint_context() for the vars"""
+    context = blueprint_context(
         latest_blueprints=latest_blueprints,
         all_blueprints=all_blueprints,
         blueprint=blueprint,
         linked_data=linked_data,
+        sidebar_html=sidebar_html,
         campaigns=campaigns,
     )
+    return TPL_BLUEPRINT.render(**context)
 
 
-def render_variant(variant: Variant, **kwargs):
+def variant_context(
+    variant: Variant,
+    linked_data: Optional[dict] = None,
+    related_variants: Optional[List[dict]] = None,
+    mitre_description: Optional[str] = None,
+    campaigns_grouped: Optional[dict] = None,
+    **kwargs,
+) -> dict:
     """
     vars
     - variant
     other vars
     - blueprint (if included, adds sidebar for campaigns)
+    - linked_data (if not provided, it is queried for the variant)
+    - related_variants (rendered variants sharing the TID. if not provided, they are queried and rendered)
+    - mitre_description (if not provided, it is looked up from the CTI data)
+    - campaigns_grouped (campaign name -> rendered variants for the blueprint sidebar.
+        if not provided and a blueprint is included, it is rendered from the blueprint)
+        callers rendering every variant page of a blueprint should render it once and pass it in
     """
 
-    linked_data = {}
-    for row in (
-        session.query(LinkedData)
-        .filter(LinkedData.variant_id == variant.id, LinkedData.target_type == LinkedDataTarget.Variant)
-        .all()
-    ):  # type: LinkedData
-        data = format_linked_data(row)
-        linked_data.setdefault(row.display_name, []).append(data)
+    if linked_data is None:
+        linked_data = {}
+        for row in session.execute(STMT_VARIANT_LINKED_DATA, {"variant_id": variant.id}).scalars():  # type: LinkedData
+            data = format_linked_data(row)
+            linked_data.setdefault(row.display_name, []).append(data)
 
     # do all this before rendering
-    related_variants = session.query(Variant).filter(Variant.tid == variant.tid).all()
-    related_variants = [variant.render() for variant in related_variants]
-    mitre_description = lookup_technique_by_tid(variant.tid)[0].description
+    if related_variants is None:
+        related_variants = [
+            related.render() for related in session.execute(STMT_RELATED_VARIANTS, {"tid": variant.tid}).scalars()
+        ]
+    if mitre_description is None:
+        mitre_description = lookup_technique_by_tid(variant.tid)[0].description
 
     # cleanup guidance
-    final_guidance = ""
-    if variant.guidance:
-        for guidance in variant.guidance:
-            guidance = guidance.strip()
-            if "\n" in guidance:
-                guidance = "\n".join([g.strip() for g in guidance.split("\n")])
-            if len(guidance) > 0 and guidance not in [None, "", "\n"]:
-                final_guidance += guidance
-                final_guidance += "\n"
-
-    campaigns_grouped = {}
+    guidance_parts = []
+    for guidance in variant.guidance or []:
+        guidance = guidance.strip()
+        if not guidance:
+            continue
+        if "\n" in guidance:
+            guidance = "\n".join([g.strip() for g in guidance.split("\n")])
+        guidance_parts.append(guidance)
+    final_guidance = "\n".join(guidance_parts) + "\n" if guidance_parts else ""
+
     if "blueprint" in kwargs:
         # if a blueprint is provided, we need to apply overrides from that blueprint
         # to the variant on the blueprint's variant page
         blueprint: Blueprint = kwargs.get("blueprint")
         variant = variant.render(apply_overrides=True, blueprint_id=blueprint.id)
-        for campaign in blueprint.child_campaigns:
-            campaigns_grouped[campaign.name] = [
-                v.render(apply_overrides=True, blueprint_id=blueprint.id) for v in campaign.variants
-            ]
+        if campaigns_grouped is None:
+            campaigns_grouped = dict(render_blueprint_campaigns(blueprint))
+        kwargs["blueprint"] = BlueprintView.from_blueprint(blueprint)
     else:
         variant = variant.render()
+        campaigns_grouped = {}
 
     # left-side menu is default all other variants in library that share a TID/
     #   if blueprint is provided, the left-side menu is all variants in that blueprint
     #   grouped by the campaign name
-    return jinja_env.get_template(Templates.Variant).render(
+    return dict(
         variant=variant,
         related_variants=related_variants,
         linked_data=linked_data,
@@ -259,6 +397,28 @@ def render_variant(variant: Variant, **kwargs):
     )
 
 
+def render_variant(
+    variant: Variant,
+    blueprint: Optional[Blueprint] = None,
+    linked_data: Optional[dict] = None,
+    related_variants: Optional[List[dict]] = None,
+    mitre_description: Optional[str] = None,
+    campaigns_grouped: Optional[dict] = None,
+) -> str:
+    """render the variant page; see variant_context() for the vars"""
+    # variant_context() only adds the blueprint sidebar when a blueprint is passed at all
+    extra = {} if blueprint is None else {"blueprint": blueprint}
+    context = variant_context(
+        variant=variant,
+        linked_data=linked_data,
+        related_variants=related_variants,
+        mitre_description=mitre_description,
+        campaigns_grouped=campaigns_grouped,
+        **extra,
+    )
+    return TPL_VARIANT.render(**context)
+
+
 def render_blueprint_variant(blueprint: Blueprint, **kwargs):
     """
     vars:
@@ -271,6 +431,86 @@ def render_blueprint_variant(blueprint: Blueprint, **kwargs):
     return render_variant(blueprint=blueprint, **kwargs)
 
 
+def iter_blueprint_files(directory: str, recurse: bool = False) -> Iterator[pathlib.Path]:
+    """
+    yield the YAML documents (.yml) in the directory, optionally recursing into subdirectories
+    uses os.scandir/os.walk as the directory entries already say whether they are files
+    """
+    if not recurse:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".yml") and entry.is_file():
+                    yield pathlib.Path(entry.path)
+    else:
+        for root, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                if file_name.endswith(".yml"):
+                    yield pathlib.Path(root, file_name)
+
+
+# (template name, output file path, template context)
+Page = Tuple[str, str, dict]
+# number of library variant pages sent to a render worker at a time
+PAGE_BATCH_SIZE = 64
+
+
+def render_page(page: Page):
+    """render a page and write it to disk; the page context must be picklable"""
+    template_name, page_file, context = page
+    # stream the output to the file as it is rendered rather than building the full page in memory first
+    TEMPLATES_BY_NAME[template_name].stream(**context).dump(page_file, encoding="utf-8")
+
+
+def write_files(files: List[Tuple[StrOrPath, bytes]], jobs: int):
+    """write the (path, contents) pairs using a thread pool as the file IO releases the GIL"""
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # consume the results so write errors are raised here
+        list(executor.map(lambda file: write_bytes_to_file(file[1], file[0]), files))
+
+
+def render_page_batch(pages: List[Page]):
+    """
+    render a batch of pages
+    pages are sent to the workers in batches so context objects shared by the pages (e.g. a blueprint's
+    campaigns) are pickled once per batch rather than once per page
+    """
+    for page in pages:
+        render_page(page)
+
+
+def render_pages(batches: Iterator[List[Page]], jobs: int):
+    """
+    render all batches of pages, split across `jobs` worker processes
+    batches are pulled from the iterator as workers free up so only a few are held in memory at once
+    """
+    # workers must be forked: a spawned worker re-imports this module and therefore libmm.sql,
+    #   which would autodelete the database file in use by the parent
+    if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("Parallel rendering requires the fork start method, rendering pages serially")
+        jobs = 1
+
+    if jobs <= 1:
+        for batch in batches:
+            render_page_batch(batch)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("fork"),
+    ) as executor:
+        pending = set()
+        for batch in batches:
+            # once every worker has a couple of batches queued, wait for one to finish before building more
+            if len(pending) >= jobs * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # raise worker exceptions here
+                    future.result()
+            pending.add(executor.submit(render_page_batch, batch))
+        for future in as_completed(pending):
+            future.result()
+
+
 @click.group()
 @click.version_option(message="version: %(version)s")
 def main():
@@ -298,6 +538,16 @@ navdir_opt = click.option(
     required=True,
 )
 
+jobs_opt = click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    help="Number of worker processes used to render pages. Defaults to the number of CPUs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    required=False,
+)
+
 recurse_opt = click.option(
     "-r",
     "--recurse",
@@ -316,7 +566,8 @@ recurse_opt = click.option(
 @SharedOptions.outdir("outdir", "output-directory", "Directory to output rendered HTML")
 @navdir_opt
 @recurse_opt
-def html(techniques, blueprint_paths, latest_json, output_directory, nav_directory, recurse):
+@jobs_opt
+def html(techniques, blueprint_paths, latest_json, output_directory, nav_directory, recurse, jobs):
     # step 1: init data and load bps
     init_db(variants_paths=techniques)
 
@@ -328,17 +579,21 @@ def html(techniques, blueprint_paths, latest_json, output_directory, nav_directo
     # invert so lookup is done based on file name -> canonical name
     latest_json = {v: k for k, v in latest_json.items()}
 
-    glob_pattern = "*.yml" if not recurse else "**/*.yml"
     for blueprint_path in blueprint_paths:
-        for yaml_doc in pathlib.Path(blueprint_path).glob(glob_pattern):
+        for yaml_doc in iter_blueprint_files(blueprint_path, recurse=recurse):
             bp = Blueprint.from_file(yaml_doc)
             all_bps.append(bp)
             if yaml_doc.name in latest_json:
                 latest_bps.append((latest_json[yaml_doc.name], bp))
 
+    # eager load the campaign -> variant relationships for all blueprints up front
+    #   rather than lazy loading them per blueprint during rendering
+    session.query(Blueprint).options(Blueprint.variants_load_option()).all()
+
     # sorting bps by length of descriptions so that row heights are *roughly* similar
-    all_bps = sorted(all_bps, key=lambda x: len(x.description))
-    latest_bps = sorted(latest_bps, key=lambda x: len(x[1].description))
+    description_lengths = {bp.id: len(bp.description) for bp in all_bps}
+    all_bps.sort(key=lambda x: description_lengths[x.id])
+    latest_bps.sort(key=lambda x: description_lengths[x[1].id])
 
     variants = session.query(Variant).all()
 
@@ -354,36 +609,93 @@ def html(techniques, blueprint_paths, latest_json, output_directory, nav_directo
     output_directory.mkdir(parents=True, exist_ok=False)
 
     # make all site directories
-    for directory in [member[0] for member in inspect.getmembers(StaticDirectories) if not member[0].startswith("__")]:
-        output_directory.joinpath(getattr(StaticDirectories, directory)).mkdir(exist_ok=True)
-
-    # render all variant files + listing
-    output_directory.joinpath(SitePaths.Variants).write_text(render_variant_listing(variants=variants))
+    for directory in StaticDirectories.All:
+        (output_directory / directory).mkdir(exist_ok=True)
+
+    # bulk load the per-page data up front rather than querying for every page
+    variant_linked_data = group_linked_data(target_type=LinkedDataTarget.Variant)
+    blueprint_linked_data = group_linked_data(target_type=LinkedDataTarget.Blueprint)
+    # related variants are rendered once per TID and shared by every page for that TID
+    related_by_tid = {}
     for variant in variants:
-        variant_file = SitePaths.Variant.format(variant_id=variant.id)
-        output_directory.joinpath(variant_file).write_text(render_variant(variant=variant))
-
-    # render all blueprint files + listing
-    output_directory.joinpath(SitePaths.Blueprints).write_text(
-        render_blueprint_listing(all_blueprints=all_bps, latest_blueprints=latest_bps)
-    )
-    for blueprint in all_bps:
-        blueprint_file = SitePaths.Blueprint.format(blueprint_id=blueprint.id)
-        output_directory.joinpath(blueprint_file).write_text(
-            render_blueprint(all_blueprints=all_bps, latest_blueprints=latest_bps, blueprint=blueprint)
-        )
-
-        blueprint_dir = SitePaths.BlueprintDir.format(blueprint_id=blueprint.id)
-        output_directory.joinpath(blueprint_dir).mkdir(exist_ok=True)
-        for variant in blueprint.variants:
-            blueprint_variant_file = SitePaths.BlueprintVariant.format(blueprint_id=blueprint.id, variant_id=variant.id)
-            output_directory.joinpath(blueprint_variant_file).write_text(
-                render_blueprint_variant(blueprint=blueprint, variant=variant)
+        related_by_tid.setdefault(variant.tid, []).append(variant.render())
+    # the CTI lookup is the most expensive per-page step so only do it once per TID
+    tid_to_description = {tid: lookup_technique_by_tid(tid)[0].description for tid in related_by_tid}
+
+    # per-item paths are formatted from SitePaths onto the site root as plain strings
+    #   rather than joining pathlib paths for every item
+    site_root = output_directory.as_posix() + "/"
+
+    sidebar_html = render_blueprint_sidebar(latest_blueprints=latest_bps, all_blueprints=all_bps)
+
+    def iter_page_batches() -> Iterator[List[Page]]:
+        """
+        build the pages with their template context, one batch at a time as the renderer asks for them
+        library variant pages are batched in fixed-size chunks and each blueprint's pages form one batch
+        """
+        batch: List[Page] = []
+        for variant in variants:
+            context = variant_context(
+                variant=variant,
+                linked_data=variant_linked_data.get(variant.id, {}),
+                related_variants=related_by_tid[variant.tid],
+                mitre_description=tid_to_description[variant.tid],
+            )
+            batch.append((Templates.Variant, site_root + SitePaths.Variant.format(variant_id=variant.id), context))
+            if len(batch) == PAGE_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+        for blueprint in all_bps:
+            # the campaigns are the same for the blueprint page and the sidebar of each of its variant pages
+            #   so render them once for all of the blueprint's pages
+            campaigns = render_blueprint_campaigns(blueprint)
+            campaigns_grouped = dict(campaigns)
+
+            context = blueprint_context(
+                all_blueprints=all_bps,
+                latest_blueprints=latest_bps,
+                blueprint=blueprint,
+                linked_data=blueprint_linked_data.get(blueprint.id, {}),
+                sidebar_html=sidebar_html,
+                campaigns=campaigns,
             )
+            batch = [(Templates.Blueprint, site_root + SitePaths.Blueprint.format(blueprint_id=blueprint.id), context)]
+
+            os.makedirs(site_root + SitePaths.BlueprintDir.format(blueprint_id=blueprint.id), exist_ok=True)
+            for variant in blueprint.variants:
+                context = variant_context(
+                    blueprint=blueprint,
+                    variant=variant,
+                    linked_data=variant_linked_data.get(variant.id, {}),
+                    related_variants=related_by_tid.get(variant.tid, []),
+                    mitre_description=tid_to_description.get(variant.tid),
+                    campaigns_grouped=campaigns_grouped,
+                )
+                page_file = site_root + SitePaths.BlueprintVariant.format(
+                    blueprint_id=blueprint.id, variant_id=variant.id
+                )
+                batch.append((Templates.Variant, page_file, context))
+            yield batch
+
+    render_pages(batches=iter_page_batches(), jobs=jobs)
+
+    # other generated files are batched and written together at the end
+    files: List[Tuple[StrOrPath, bytes]] = []
+
+    # variant + blueprint listings
+    files.append((output_directory / SitePaths.Variants, render_variant_listing(variants=variants).encode()))
+    blueprint_listing = render_blueprint_listing(all_blueprints=all_bps, latest_blueprints=latest_bps).encode()
+    files.append((output_directory / SitePaths.Blueprints, blueprint_listing))
+    # alias bundle listing to index
+    files.append((output_directory / SitePaths.Index, blueprint_listing))
 
+    for blueprint in all_bps:
         manifest = gen_blueprint_export(blueprint=blueprint, export_type=BlueprintExport.Manifest)
-        manifest_file = SitePaths.Manifest.format(blueprint_id=blueprint.id)
-        dump_yaml_to_file(manifest, output_directory.joinpath(manifest_file))
+        manifest_yaml = dump_yaml_to_str(manifest, round_trip=False)
+        files.append((site_root + SitePaths.Manifest.format(blueprint_id=blueprint.id), manifest_yaml.encode()))
 
         layer = gen_blueprint_export(blueprint=blueprint, export_type=BlueprintExport.NavigatorLayer)
         # patch the layer to hide disabled techniques and
@@ -391,27 +703,22 @@ def html(techniques, blueprint_paths, latest_json, output_directory, nav_directo
         #   to avoid getting prompted to migrate layer versions
         layer["hideDisabled"] = True
         layer["versions"] = {"layer": "4.5"}
-        layer_file = SitePaths.NavigatorLayer.format(blueprint_id=blueprint.id)
-        dump_json_to_file(layer, output_directory.joinpath(layer_file))
+        files.append(
+            (site_root + SitePaths.NavigatorLayer.format(blueprint_id=blueprint.id), dump_json_to_bytes(layer))
+        )
 
         summary_csv = gen_summary_csv_from_blueprint(blueprint=blueprint)
-        csv_file = SitePaths.Summaries.format(blueprint_id=blueprint.id)
-        output_directory.joinpath(csv_file).write_text(summary_csv)
+        files.append((site_root + SitePaths.Summaries.format(blueprint_id=blueprint.id), summary_csv.encode()))
 
-    # alias bundle listing to index
-    shutil.copy(output_directory.joinpath(SitePaths.Blueprints), output_directory.joinpath(SitePaths.Index))
+    write_files(files=files, jobs=jobs)
 
     # copy navigator
     shutil.copytree(nav_directory, output_directory.joinpath(StaticDirectories.NavigatorUI), dirs_exist_ok=True)
     nav_index = output_directory.joinpath(SitePaths.NavigatorIndex)
     # relocate paths to new subdirectory in nav index
-    nav_index_body = (
-        nav_index.read_text()
-        .replace('href="', 'href="/navigator/')
-        .replace('src="', 'src="/navigator/')
-        .replace("//", "/")  # fixes double '/' in <base> href
-    )
-    nav_index.write_text(nav_index_body)
+    nav_index_body = NAV_INDEX_PATH_RE.sub(r'\1="/navigator/', nav_index.read_text())
+    nav_index_body = nav_index_body.replace("//", "/")  # fixes double '/' in <base> href
+    write_bytes_to_file(nav_index_body.encode(), nav_index)
 
 
 main.add_command(html)
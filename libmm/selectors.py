@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import shlex
+import re
 from abc import abstractmethod
 from sqlalchemy import cast
 from sqlalchemy.orm.query import Query
@@ -22,10 +23,16 @@ class SelectorKeyEnum(Enum):
 
     @classmethod
     def _missing_(cls, value):
-        for member in cls:
-            if member.name.lower() == value.lower().replace("_", ""):
-                return member
-        raise KeyError(f"{value} is not a valid enum member")
+        # the normalized name -> member map is built on first lookup as members do not exist yet
+        #   when __init_subclass__ runs. read from the class __dict__ so subclasses do not share a map
+        normalized_map = cls.__dict__.get("_normalized_map")
+        if normalized_map is None:
+            normalized_map = {member.name.lower(): member for member in cls}
+            cls._normalized_map = normalized_map
+        member = normalized_map.get(value.lower().replace("_", ""))
+        if member is None:
+            raise KeyError(f"{value} is not a valid enum member")
+        return member
 
     @property
     @abstractmethod
@@ -101,6 +108,14 @@ class SelectorProps:
     CTR_END = ")"
 
 
+# selector(<type> <filters...>)
+SELECTOR_RE = re.compile(
+    rf"^{re.escape(SelectorProps.PREFIX + SelectorProps.CTR_START)}(\S+?)(?:\s+(.*))?{re.escape(SelectorProps.CTR_END)}$",
+    flags=re.DOTALL,
+)
+SELECTOR_CMP_RE = re.compile(r"(==|~=)")
+
+
 @dataclass
 class SelectorFilter:
     key: SelectorKeyT
@@ -137,37 +152,32 @@ class Selector:
 
     @classmethod
     def from_str(cls, v: str):
-        left_side = f"{SelectorProps.PREFIX}{SelectorProps.CTR_START}"
-        right_side = SelectorProps.CTR_END
-        if v.startswith(left_side) and v.endswith(right_side):
-            v = v.replace(left_side, "").replace(right_side, "")
-            selector_type_str = v.split(" ")[0]
-            try:
-                selector_type = SelectorType(selector_type_str)
-            except KeyError as e:
-                raise e
-
-            # Lark feels a bit heavy for what this currently supports
-            # but will revisit if this needs expanding
-            selectors = v.replace(f"{selector_type_str} ", "")
-            filters = []
-            for token in shlex.split(selectors):
-                approximate_cmp = False
-                if "==" in token:
-                    selector_key, selector_value = token.split("==")
-                elif "~=" in token:
-                    selector_key, selector_value = token.split("~=")
-                    approximate_cmp = True
-                else:
-                    selector_key, selector_value = token, None
-                filters.append(
-                    SelectorFilter(
-                        key=selector_type.key_type(selector_key), value=selector_value, approximate=approximate_cmp
-                    )
+        match = SELECTOR_RE.match(v)
+        if match is None:
+            raise ValueError(f"Value {v} is not a valid selector")
+
+        selector_type_str, selectors = match.groups()
+        try:
+            selector_type = SelectorType(selector_type_str)
+        except KeyError as e:
+            raise e
+
+        # Lark feels a bit heavy for what this currently supports
+        # but will revisit if this needs expanding
+        filters = []
+        for token in shlex.split(selectors or ""):
+            # splits to [key, operator, value] or just [key] if there is no operator
+            parts = SELECTOR_CMP_RE.split(token, maxsplit=1)
+            if len(parts) == 3:
+                selector_key, operator, selector_value = parts
+            else:
+                selector_key, operator, selector_value = token, None, None
+            filters.append(
+                SelectorFilter(
+                    key=selector_type.key_type(selector_key), value=selector_value, approximate=operator == "~="
                 )
-            return cls(type=selector_type, filters=filters)
-
-        raise ValueError(f"Value {v} is not a valid selector")
+            )
+        return cls(type=selector_type, filters=filters)
 
     def get_matches(self):
         table = self.type.table
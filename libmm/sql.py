@@ -1,15 +1,21 @@
 from sqlmodel import create_engine, Field, String, Relationship
-from sqlalchemy import Column, Enum as SAEnum, UniqueConstraint
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import Column, Enum as SAEnum, UniqueConstraint, Index, event
+from sqlalchemy.orm import sessionmaker, scoped_session, selectinload
 import sqlalchemy.types as sa_types
 from uuid import uuid4
 from sqlmodel import SQLModel as OriginalSQLModel
-from copy import copy
 from pydantic import PrivateAttr
-from collections import OrderedDict
 from abc import abstractmethod
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from .config import global_settings
 from .type import (
     OptionalStrList,
@@ -22,9 +28,9 @@ from .type import (
     CaseInsensitiveEnum,
     auto,
 )
-from .utils import load_yaml_from_file, resolve_str_or_path
+from .utils import load_yaml_from_file, resolve_str_or_path, parse_variant_file, try_parse_variant_file
 from .log import logger, LoggedException
-from .mitre import get_d3fend_off_artifacts_for_tid, get_d3fend_ctrm_for_artifact
+from .mitre import get_d3fend_details_for_tid
 
 # sqlmodel uses sqlalchemy v1.4 and pydantic 1.10
 
@@ -34,7 +40,9 @@ class SQLModel(OriginalSQLModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__post_init__()
-        extensions_manager.emit_event(event=EventPairs.DbOjectInit, object=self)
+        # skip the emit for the rows loaded in bulk when no extension listens for it
+        if extensions_manager.has_listeners(EventPairs.DbOjectInit):
+            extensions_manager.emit_event(event=EventPairs.DbOjectInit, object=self)
 
     def __post_init__(self):
         pass
@@ -58,9 +66,9 @@ class StrListType(sa_types.TypeDecorator):
 
     def process_bind_param(self, value, dialect):
         if value is not None:
-            if value == [None]:
+            if not value or value == [None]:
                 return ""
-            return f"{global_settings.db_text_delimiter}".join(value)
+            return global_settings.db_text_delimiter.join(value)
         return value
 
     def process_result_value(self, value, dialect):
@@ -74,6 +82,7 @@ class DictType(sa_types.TypeDecorator):
     SQLAlchemy type for Python dict.
     For serialization, converts dict into string using default json.dumps().
     For deserialization, converts back using default json.loads().
+    Uses orjson in place of json when it is installed.
     Only modifies values when for non-null values.
     """
 
@@ -83,11 +92,16 @@ class DictType(sa_types.TypeDecorator):
 
     def process_bind_param(self, value, dialect):
         if value is not None:
+            if orjson is not None:
+                # non-str keys are converted to strings the same as json.dumps
+                return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
             return json.dumps(value)
         return value
 
     def process_result_value(self, value, dialect):
         if value is not None:
+            if orjson is not None:
+                return orjson.loads(value)
             return json.loads(value)
         return value
 
@@ -101,6 +115,28 @@ def uuid_field() -> Field:
     return Field(default_factory=lambda: str(uuid4()), sa_column=Column(String, primary_key=True))
 
 
+# set by bulk_load() to skip the per-instance Variant checks
+_skip_variant_checks = False
+
+
+@contextmanager
+def bulk_load():
+    """
+    skip the Variant checks that run on init while loading many Variants
+    callers are expected to run the checks themselves once loading is done
+    """
+    global _skip_variant_checks
+    _skip_variant_checks = True
+    try:
+        yield
+    finally:
+        _skip_variant_checks = False
+
+
+# x_ metadata values that are treated as empty and left out of rendered Variants
+_EMPTY_X_VALUES = (None, "", [], [None], [""])
+
+
 class VariantCampaignLink(SQLModel, table=True):
     campaign_id: Optional[str] = Field(default=None, foreign_key="blueprintcampaign.id", primary_key=True)
     variant_id: Optional[str] = Field(default=None, foreign_key="variant.id", primary_key=True)
@@ -112,6 +148,10 @@ class VariantGroupLink(SQLModel, table=True):
 
 
 class Variant(SQLModel, table=True):
+    # lookup_variant filters on (tid, name, version)
+    #   not unique as lookup_variant is responsible for reporting duplicates across libraries
+    __table_args__ = (Index("ix_variant_tid_name_version", "tid", "name", "version"),)
+
     id: str = uuid_field()
     mav: Optional[int]
     # md: dict = Field(sa_column=Column(PickleType))
@@ -150,6 +190,10 @@ class Variant(SQLModel, table=True):
     def __post_init__(self):
         from .checks import VariantChecks
 
+        # checks are run separately for all Variants at the end of a bulk load
+        if _skip_variant_checks:
+            return
+
         # perform runtime validation checks
         # TODO: once field validators are implemented, some of these checks can probably be
         #       converted into field validators
@@ -174,7 +218,7 @@ class Variant(SQLModel, table=True):
         """
 
         original_dict = self.dict()
-        final_dict = OrderedDict()
+        final_dict = {}
 
         # using Field(alias="foo", ...) requires using the alias in the cosntructor instead of
         # the actual name
@@ -199,11 +243,7 @@ class Variant(SQLModel, table=True):
 
         # process overrides
         if apply_overrides and blueprint_id:
-            override: VariantOverride = (
-                session.query(VariantOverride)
-                .filter(VariantOverride.variant_id == self.id, VariantOverride.blueprint_id == blueprint_id)
-                .first()
-            )
+            override: Optional[VariantOverride] = get_override_cache().get((self.id, blueprint_id))
             if override:
                 # doing this individually as overrides only cover a few fields
                 # in the future, might do this more dynamically
@@ -219,24 +259,20 @@ class Variant(SQLModel, table=True):
             # Note: For VECTR uses, you may want to leave this disabled
             #       as newer VECTR versions will retain the test case template tags
             #       when creating the user mode test case
-            if len(self.groups) > 0:
-                metadata["groups"] = list(set([group.name for group in self.groups]))
+            if self.groups:
+                metadata["groups"] = list({group.name for group in self.groups})
 
         # delete empty x_ metadata
-        final_dict["metadata"] = copy(metadata)
-        for k, v in metadata.items():
-            if k.startswith("x_") and v in [None, "", [], [None], [""]]:
-                del final_dict["metadata"][k]
+        final_dict["metadata"] = {k: v for k, v in metadata.items() if not (k[:2] == "x_" and v in _EMPTY_X_VALUES)}
 
         # optionally add MITRE D3FEND details based on TID
         if global_settings.add_d3fend:
             d3fend_list = []
 
-            mapping_artifacts = list(get_d3fend_off_artifacts_for_tid(tid=self.tid))
+            # the details are cached per TID so build new lists from them for each render
+            mapping_artifacts = get_d3fend_details_for_tid(tid=self.tid)
             if len(mapping_artifacts) > 0:
-                for artifact in mapping_artifacts:
-                    countermeasures = get_d3fend_ctrm_for_artifact(artifact)
-
+                for artifact, countermeasures in mapping_artifacts:
                     if len(countermeasures) > 0:
                         d3fend_list.append({artifact: list(countermeasures)})
                     else:
@@ -251,21 +287,20 @@ class Variant(SQLModel, table=True):
                 """
                 final_dict["x_d3fend"] = d3fend_list
 
-        final_dict = dict(final_dict)
-
-        extensions_manager.emit_event(event=EventPairs.TestCaseRender, variant=final_dict)
+        if extensions_manager.has_listeners(EventPairs.TestCaseRender):
+            extensions_manager.emit_event(event=EventPairs.TestCaseRender, variant=final_dict)
         return final_dict
 
     @classmethod
-    def from_yaml(cls, y: dict, **kwargs):
+    def _build_from_yaml(cls, y: dict, **kwargs) -> "Variant":
+        """create the Variant from its yaml without adding it to the session"""
         # store x_ metadata separately then pass remaining metata to constructor
         _x_metadata = {}
         if "metadata" in y:
-            metadata = copy(y["metadata"])
-            for k, v in metadata.items():
-                if k.startswith("x_"):
-                    _x_metadata[k] = v
-                    del y["metadata"][k]
+            metadata = y["metadata"]
+            # collect the keys first so the metadata can be popped from without copying it
+            for k in [k for k in metadata if k[:2] == "x_"]:
+                _x_metadata[k] = metadata.pop(k)
         else:
             y["metadata"] = {}
 
@@ -284,17 +319,30 @@ class Variant(SQLModel, table=True):
         o = cls(**kwargs, **y, **y["metadata"])
         setattr(o, "_x_metadata", _x_metadata)  # this is on the instance, not the db
         # TODO: not sure what to do with x_ metadata yet
+        return o
 
+    @classmethod
+    def from_yaml(cls, y: dict, **kwargs):
+        o = cls._build_from_yaml(y, **kwargs)
         session.add(o)
         session.commit()
+        # the new variant may conflict with or be missing from the lookup index
+        _variant_index.clear()
         return o
 
+    @classmethod
+    def _build_from_file(cls, filepath: StrOrPath) -> "Variant":
+        """create the Variant from its file without adding it to the session"""
+        y, version, name = parse_variant_file(filepath)
+        return cls._build_from_yaml(y, version=version, name=name, filepath=filepath.as_posix())
+
     @classmethod
     def from_file(cls, filepath: StrOrPath):
-        path = resolve_str_or_path(filepath)
-        version = int(path.stem[1:])
-        name = path.parent.name
-        variant = cls.from_yaml(load_yaml_from_file(path), version=version, name=name, filepath=filepath.as_posix())
+        variant = cls._build_from_file(filepath)
+        session.add(variant)
+        session.commit()
+        # the new variant may conflict with or be missing from the lookup index
+        _variant_index.clear()
         return variant
 
 
@@ -341,6 +389,23 @@ class Blueprint(SQLModel, table=True):
     def variants(self) -> List[Variant]:
         return [variant for campaign in self.child_campaigns for variant in campaign.variants]
 
+    @staticmethod
+    def variants_load_option():
+        """
+        SA loader option that eager loads campaigns -> variants -> variant groups
+        uses one IN query per relationship instead of lazy loading each collection on access
+        """
+        return (
+            selectinload(Blueprint.child_campaigns)
+            .selectinload(BlueprintCampaign.variants)
+            .selectinload(Variant.groups)
+        )
+
+    @classmethod
+    def get_with_variants(cls, blueprint_id: str) -> "Blueprint":
+        """return the Blueprint with the relationships used when rendering its Variants eager loaded"""
+        return session.query(cls).options(cls.variants_load_option()).filter(cls.id == blueprint_id).one()
+
     @classmethod
     def from_yaml(cls, y: dict):
         metadata = {}
@@ -360,11 +425,13 @@ class Blueprint(SQLModel, table=True):
         # groups set in the blueprint are processed at the database level regardless
         # of the add_groups global settings
         # the add_groups settings *only* covers test cases rendering
+        groups_by_tid = {}  # tid -> groups in this blueprint
         if "groups" in y:
             for group_name, tids in y["groups"].items():
                 for tid in tids:
                     group = BlueprintGroup(name=group_name, tid=tid, blueprint=blueprint)
                     session.add(group)
+                    groups_by_tid.setdefault(tid, []).append(group)
 
         if "campaigns" in y:
             for campaign_name, block in y["campaigns"].items():
@@ -400,10 +467,7 @@ class Blueprint(SQLModel, table=True):
                                 do_override = True
                                 version_str = str(variant_list_item.get("version"))
 
-                            if ";" in version_str:
-                                versions = [version.strip() for version in version_str.split(";")]
-                            else:
-                                versions = [version_str]
+                            versions = [version.strip() for version in version_str.split(";")]
 
                             for version in versions:
                                 try:
@@ -430,14 +494,11 @@ class Blueprint(SQLModel, table=True):
                                     session.add(override)
 
                                 # handle blueprint-level groups based on matching tid+blueprint
-                                group_matches = (
-                                    session.query(BlueprintGroup)
-                                    .filter(BlueprintGroup.tid == tid, BlueprintGroup.blueprint_id == blueprint.id)
-                                    .all()
-                                )
-                                variant.groups.extend(group_matches)
+                                variant.groups.extend(groups_by_tid.get(tid, []))
 
         session.commit()
+        # new overrides may have been added
+        invalidate_override_cache()
         blueprint.emit_loaded()
         return blueprint
 
@@ -562,11 +623,36 @@ class LinkedData(SQLModel, table=True):
 if global_settings.db_file_path and not global_settings.db_file_path.startswith("//"):
     # autodelete is useful if you dont want to worry about schema changes
     if global_settings.db_file_autodelete:
-        resolve_str_or_path(global_settings.db_file_path).unlink(missing_ok=True)
+        db_file = resolve_str_or_path(global_settings.db_file_path)
+        db_file.unlink(missing_ok=True)
+        # remove WAL files left from a previous run too so they are not applied to the new database
+        for suffix in ["-wal", "-shm"]:
+            db_file.with_name(db_file.name + suffix).unlink(missing_ok=True)
 
     global_settings.db_file_path = f"/{global_settings.db_file_path}"
 
 engine = create_engine(f"sqlite://{global_settings.db_file_path}")
+
+SQLITE_FAST_PRAGMAS = [
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",  # 64 MiB
+    "mmap_size=268435456",  # 256 MiB
+]
+
+
+if global_settings.db_fast_pragmas:
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # trades durability on power loss for faster commits, see LIBMM_DB_FAST_PRAGMAS
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_FAST_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
 SQLModel.metadata.create_all(engine)
 session_factory = sessionmaker(bind=engine, expire_on_commit=False)
 Session = scoped_session(session_factory)
@@ -599,15 +685,65 @@ def ingest_variants_from_library(paths: List[StrOrPath]):
     """
     Load Variants from one or more library paths into the database
     """
+    from .checks import VariantChecks
+
     exceptions = False
-    for path in paths:
-        path = resolve_str_or_path(path)
-        for variant_file in path.rglob("*.yml"):
-            try:
-                Variant.from_file(variant_file)
-            except Exception as e:
-                logger.error(f"{variant_file.as_posix()}: {e}")
+    variant_files = [variant_file for path in paths for variant_file in resolve_str_or_path(path).rglob("*.yml")]
+
+    # parsing is independent per file so it can be spread across processes
+    #   the Variants are still created and saved in this process as they share the session
+    parallel = global_settings.parallel_ingest and len(variant_files) > 1
+    # workers must be forked: spawned/forkserver workers re-import the main module, which imports this module
+    #   and its import-time setup would autodelete the database file in use by this process
+    if parallel and "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("Parallel ingest requires the fork start method, parsing Variant files serially")
+        parallel = False
+
+    if parallel:
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork")) as executor:
+            parsed_files = list(executor.map(try_parse_variant_file, variant_files, chunksize=32))
+    else:
+        parsed_files = map(try_parse_variant_file, variant_files)
+
+    variants = {}  # id -> variant
+    with bulk_load():
+        for variant_file, (parsed, error) in zip(variant_files, parsed_files):
+            if error is None:
+                y, version, name = parsed
+                try:
+                    variant = Variant._build_from_yaml(y, version=version, name=name, filepath=variant_file.as_posix())
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                logger.error(f"{variant_file.as_posix()}: {error}")
+                exceptions = True
+                continue
+
+            # check for duplicate IDs here so the error can point at the file
+            #   otherwise it would only surface when the whole batch is committed
+            if variant.id in variants:
+                logger.error(f'{variant_file.as_posix()}: Duplicate Variant ID "{variant.id}"')
                 exceptions = True
+                continue
+            variants[variant.id] = variant
+
+    # run the init checks skipped during the bulk load in a single pass
+    for variant in variants.values():
+        VariantChecks.VariantTidPathTidMatch.run(variant)
+
+    # insert every variant in a single transaction rather than committing per file
+    #   add_all is used over bulk_save_objects as the latter leaves the objects detached from the session
+    with session.no_autoflush:
+        session.add_all(variants.values())
+    try:
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Failed to save Variants: {e}")
+        exceptions = True
+
+    build_variant_index()
+
     if exceptions:
         raise LoggedException("Errors encountered when loading Variants from library(s)")
 
@@ -616,6 +752,52 @@ def init_db(variants_paths: List[StrOrPath]):
     ingest_variants_from_library(paths=variants_paths)
 
 
+# (variant id, blueprint id) -> VariantOverride for Variant.render
+#   loaded on first use and cleared when a Blueprint is loaded
+_override_cache: Optional[dict] = None
+
+
+def get_override_cache() -> dict:
+    """return the (variant id, blueprint id) -> VariantOverride mapping, loading it if needed"""
+    global _override_cache
+    if _override_cache is None:
+        _override_cache = {}
+        # a variant can be overridden once per campaign so keep the first by campaign ID to match
+        #   the previous per-render query (which used the primary key index)
+        for override in session.query(VariantOverride).order_by(
+            VariantOverride.variant_id, VariantOverride.blueprint_id, VariantOverride.campaign_id
+        ):  # type: VariantOverride
+            _override_cache.setdefault((override.variant_id, override.blueprint_id), override)
+    return _override_cache
+
+
+def invalidate_override_cache():
+    global _override_cache
+    _override_cache = None
+
+
+# (tid, name, version) -> Variant ID for lookup_variant
+#   keys that match more than one Variant are left out so lookup_variant falls back to the query
+#   and reports the duplicate
+#   IDs are stored rather than instances so the index does not keep every Variant alive in the session
+_variant_index = {}
+
+
+def build_variant_index():
+    """(re)build the lookup_variant index from the Variants in the database"""
+    index, duplicates = {}, set()
+    for variant_id, tid, name, version in session.query(Variant.id, Variant.tid, Variant.name, Variant.version):
+        key = (tid, name, int(version))
+        if key in index:
+            duplicates.add(key)
+        index[key] = variant_id
+    for key in duplicates:
+        del index[key]
+
+    _variant_index.clear()
+    _variant_index.update(index)
+
+
 def lookup_variant(tid: str, name: str, version) -> Variant:
     """
     Variant entries are identified by three pieces of information:
@@ -632,6 +814,11 @@ def lookup_variant(tid: str, name: str, version) -> Variant:
     a YAML key of `name`. The former is the name and the latter is the
     display name. The (file path) name is used for lookups.
     """
+    # session.get returns the instance from the identity map when it is already loaded
+    if (variant_id := _variant_index.get((tid, name, int(version)))) is not None:
+        if variant := session.get(Variant, variant_id):
+            return variant
+
     results = (
         session.query(Variant).filter(Variant.name == name, Variant.version == int(version), Variant.tid == tid).all()
     )
@@ -1,6 +1,6 @@
 # note: IDEs such as PyCharm will mark these typing imports as unused even if they are used indirectly
 #   for type hinting
-from typing import List, Optional, Any, Union, TypeVar, Set, Tuple, Callable
+from typing import List, Optional, Any, Union, TypeVar, Set, Tuple, Callable, Iterator
 from enum import Enum, auto
 from pathlib import Path
 
@@ -20,10 +20,16 @@ class CaseInsensitiveEnum(Enum):
     def _missing_(cls, value):
         # see: https://docs.python.org/3/library/enum.html#enum.Enum._missing_
         #   note that the lookup here is by name rather than by value
-        for member in cls:
-            if member.name.lower() == value.lower():
-                return member
-        raise KeyError(f"{value} is not a valid enum member")
+        # the lowercase name -> member map is built on first lookup and stored per-class
+        #   (read from the class __dict__ so subclasses do not share a map)
+        lookup = cls.__dict__.get("_ci_lookup")
+        if lookup is None:
+            lookup = {member.name.lower(): member for member in cls}
+            cls._ci_lookup = lookup
+        member = lookup.get(value.lower())
+        if member is None:
+            raise KeyError(f"{value} is not a valid enum member")
+        return member
 
 
 CaseInsensitiveEnumT = TypeVar("CaseInsensitiveEnumT", bound=CaseInsensitiveEnum)
@@ -1,5 +1,6 @@
 import os
 from ruamel.yaml import YAML
+from ruamel.yaml.representer import SafeRepresenter, RoundTripRepresenter
 from pathlib import Path
 import random
 import string
@@ -7,16 +8,24 @@ import re
 import json
 from uuid import UUID
 import io
+import pickle
+import threading
+from collections import OrderedDict
 
-from .type import List, StrOrPath, Optional, Any, Union
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-JSON_DUMP_ARGS = {"indent": 4, "sort_keys": True}
+from .type import List, StrOrPath, Optional, Any, Union, Tuple
+
+# keys are written in insertion order, the navigator layers are built with a fixed field order
+JSON_DUMP_ARGS = {"indent": 4}
 
 
-_y = YAML(typ="rt", pure=True)
-_y.width = float("inf")  # disable line wrapping based on width
 # custom representer to have empty lists display as None
-original_list_repr = _y.representer.yaml_representers[list]
+#   the representers are stored on the class so this applies to every round-trip YAML object
+original_list_repr = RoundTripRepresenter.yaml_representers[list]
 
 
 def new_list_repr(self, data):
@@ -26,12 +35,73 @@ def new_list_repr(self, data):
     return original_list_repr(self, data)
 
 
-_y.representer.yaml_representers[list] = new_list_repr
+RoundTripRepresenter.yaml_representers[list] = new_list_repr
+
+# ruamel YAML objects keep parser/emitter state so they are not safe to share between threads
+#   each thread lazily creates and reuses its own objects instead
+_yaml_local = threading.local()
 
 
 def get_yaml_o() -> YAML:
-    """returns a ruamel YAML object configured for round-trip loading"""
-    return _y
+    """returns a ruamel YAML object configured for round-trip loading, one per thread"""
+    y = getattr(_yaml_local, "rt", None)
+    if y is None:
+        y = _yaml_local.rt = YAML(typ="rt", pure=True)
+        y.width = float("inf")  # disable line wrapping based on width
+    return y
+
+
+class _SafeRepresenter(SafeRepresenter):
+    """safe representer that matches the round-trip output for empty lists and None values"""
+
+    def represent_none(self, data):
+        # same as the round-trip representer: only a top-level None is written out as "null"
+        if len(self.represented_objects) == 0:
+            return self.represent_scalar("tag:yaml.org,2002:null", "null")
+        return self.represent_scalar("tag:yaml.org,2002:null", "")
+
+    def represent_list(self, data):
+        if len(data) == 0:
+            return self.represent_scalar("tag:yaml.org,2002:null", "")
+        return super().represent_list(data)
+
+
+_SafeRepresenter.add_representer(type(None), _SafeRepresenter.represent_none)
+_SafeRepresenter.add_representer(list, _SafeRepresenter.represent_list)
+# round-trip loaded values (e.g. ruamel's scalar strings and CommentedMap/Seq) are subclasses of the base types
+#   and have no exact-type representer here so fall back to the base type representers
+_SafeRepresenter.add_multi_representer(str, lambda self, data: self.represent_str(str(data)))  # C emitter needs a str
+_SafeRepresenter.add_multi_representer(list, _SafeRepresenter.represent_list)
+_SafeRepresenter.add_multi_representer(dict, _SafeRepresenter.represent_dict)
+
+
+def get_yaml_safe_o() -> YAML:
+    """
+    returns a ruamel YAML object configured for safe loading/dumping, one per thread
+    the safe loader/dumper uses the libyaml C parser/emitter (ruamel.yaml.clib) when it is available
+        the data is the same as the round-trip output but formatting can differ (e.g. quoting of multi-line strings)
+        so this is only used for exports that will not be hand-edited
+    """
+    y = getattr(_yaml_local, "safe", None)
+    if y is None:
+        y = _yaml_local.safe = YAML(typ="safe", pure=False)
+        y.Representer = _SafeRepresenter
+        y.width = 2**30  # the C emitter requires an int width
+        y.default_flow_style = False
+        y.sort_base_mapping_type_on_output = False  # keep insertion order like the round-trip dumper
+    return y
+
+
+# libyaml writes a space after the key of an empty value (e.g. "prerequisites: ") where the round-trip dumper does not
+_SAFE_EMPTY_VALUE_RE = re.compile(r": $", re.MULTILINE)
+
+
+def _dump_yaml_safe_to_str(yaml_: dict) -> str:
+    """serialize the provided dict with the safe dumper, trimming the trailing space after empty values"""
+    # the C emitter writes str unless an output encoding is set
+    buf = io.StringIO()
+    get_yaml_safe_o().dump(yaml_, buf)
+    return _SAFE_EMPTY_VALUE_RE.sub(":", buf.getvalue())
 
 
 class COLORS:
@@ -42,93 +112,232 @@ class COLORS:
     PURPLE = "#7a34eb"
 
 
-# https://stackoverflow.com/a/50173148
 def deep_get(d: dict, keys: List) -> Optional[Any]:
     """safely get a nested value from a dict if it exists"""
-    if not keys or d is None:
-        return d
-    return deep_get(d.get(keys[0]), keys[1:])
+    for key in keys:
+        if d is None:
+            return None
+        d = d.get(key)
+    return d
 
 
 def deep_pop(d: dict, keys: List):
     """safely pop a nested value from a dict if it exists"""
-    if len(keys) == 1:
-        try:
-            del d[keys[0]]
-        except KeyError:
-            pass
-    elif len(keys) > 1:
-        if keys[0] in d and isinstance(d[keys[0]], dict):
-            deep_pop(d[keys[0]], keys[1:])
+    if not keys:
+        return
+    # walk down to the parent of the last key, stopping if any level along the way is not a dict
+    for i in range(len(keys) - 1):
+        d = d.get(keys[i])
+        if not isinstance(d, dict):
+            return
+    d.pop(keys[-1], None)
+
+
+_RANDOM_STRING_ALPHABET = string.ascii_lowercase + string.digits
 
 
 def gen_random_string(length: int = 8) -> str:
     """return a random n-length string that uses only digits and lowercase letters"""
-    return "".join(random.choice(string.ascii_lowercase + string.digits) for _ in range(length))
+    return "".join(random.choices(_RANDOM_STRING_ALPHABET, k=length))
 
 
 def resolve_str_or_path(path: StrOrPath) -> Path:
-    """given a string or a pathlib Path, return the resolved Path"""
-    return path.resolve() if type(path) == Path else Path(path).resolve()
-
-
-def load_yaml_from_file(yaml_file: StrOrPath) -> dict:
-    """return the deserialized yaml data from the provided file path"""
-    return get_yaml_o().load(resolve_str_or_path(yaml_file))
-
-
-def dump_yaml_to_file(yaml_: dict, yaml_file: StrOrPath):
-    """serialize the provided dict to the file path"""
-    get_yaml_o().dump(yaml_, resolve_str_or_path(yaml_file))
-
-
-def dump_yaml_to_str(yaml_: dict) -> str:
-    """serialize the provided dict to the file path"""
-    strbuf = io.StringIO()
-    get_yaml_o().dump(yaml_, strbuf)
-    result = strbuf.getvalue()
-    strbuf.close()
-    return result
+    """
+    given a string or a pathlib Path, return the resolved Path
+    absolute Paths without ".." parts are returned as-is to skip the filesystem calls made by resolve()
+        (e.g. the paths from rglob on an already resolved directory)
+    """
+    if isinstance(path, Path) and path.is_absolute() and ".." not in path.parts:
+        return path
+    return Path(path).resolve()
+
+
+# (path, mtime, size) -> pickled safe-loaded data for load_yaml_from_file, least recently used first
+#   the data is stored pickled so each caller gets its own copy to mutate (unpickling is faster than deepcopy)
+_yaml_cache: "OrderedDict[Tuple[str, int, int], bytes]" = OrderedDict()
+_yaml_cache_lock = threading.Lock()
+YAML_CACHE_SIZE = 128
+
+
+def load_yaml_from_file(yaml_file: StrOrPath, round_trip: bool = False) -> dict:
+    """
+    return the deserialized yaml data from the provided file path
+    uses the safe loader (libyaml C parser when available) so the data contains only plain python types
+    round_trip=True uses the round-trip loader instead for when the data will be edited and written back
+    safe-loaded files are cached until they are modified, round-trip loads are never cached
+    """
+    path = resolve_str_or_path(yaml_file)
+    # the parser reads from the binary file handle directly rather than ruamel opening the path itself
+    if round_trip:
+        with path.open("rb") as f:
+            return get_yaml_o().load(f)
+
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _yaml_cache_lock:
+        cached = _yaml_cache.get(key)
+        if cached is not None:
+            _yaml_cache.move_to_end(key)
+    if cached is not None:
+        return pickle.loads(cached)
+
+    with path.open("rb") as f:
+        data = get_yaml_safe_o().load(f)
+    cached = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    with _yaml_cache_lock:
+        _yaml_cache[key] = cached
+        if len(_yaml_cache) > YAML_CACHE_SIZE:
+            _yaml_cache.popitem(last=False)
+    return data
+
+
+def parse_variant_file(variant_file: StrOrPath) -> Tuple[dict, int, str]:
+    """
+    load a Variant file, returning the yaml data along with the version and name from its path
+    Variant files are stored at <tid>/<name>/v<version>.yml
+    """
+    path = resolve_str_or_path(variant_file)
+    version = int(path.stem[1:])
+    name = path.parent.name
+    return load_yaml_from_file(path), version, name
+
+
+def try_parse_variant_file(variant_file: StrOrPath) -> Tuple[Optional[Tuple[dict, int, str]], Optional[str]]:
+    """
+    parse_variant_file() that returns (result, None) on success and (None, error message) on failure
+    so that one bad file does not stop a worker pool
+    """
+    try:
+        return parse_variant_file(variant_file), None
+    except Exception as e:
+        return None, str(e)
+
+
+def dump_yaml_to_file(yaml_: dict, yaml_file: StrOrPath, round_trip: bool = True):
+    """
+    serialize the provided dict to the file path
+    round_trip=False uses the faster C-backed safe dumper, see get_yaml_safe_o()
+    """
+    with resolve_str_or_path(yaml_file).open("w", encoding="utf-8") as f:
+        if round_trip:
+            get_yaml_o().dump(yaml_, f)
+        else:
+            f.write(_dump_yaml_safe_to_str(yaml_))
+
+
+def dump_yaml_to_str(yaml_: dict, round_trip: bool = True) -> str:
+    """
+    serialize the provided dict to a string
+    round_trip=False uses the faster C-backed safe dumper, see get_yaml_safe_o()
+    """
+    if not round_trip:
+        return _dump_yaml_safe_to_str(yaml_)
+    # the dumper writes utf-8 bytes to a binary buffer which is decoded once at the end
+    buf = io.BytesIO()
+    get_yaml_o().dump(yaml_, buf)
+    return buf.getvalue().decode("utf-8")
 
 
 def load_json_from_file(json_file: StrOrPath) -> dict:
-    """return the deserialized json data from the provided file path"""
-    return json.loads(resolve_str_or_path(json_file).read_bytes())
+    """
+    return the deserialized json data from the provided file path
+    uses orjson when it is installed, otherwise falls back to the standard json module
+    """
+    data = resolve_str_or_path(json_file).read_bytes()
+    if orjson is not None:
+        # json.loads accepts a leading UTF-8 BOM but orjson rejects it
+        return orjson.loads(data[3:] if data[:3] == b"\xef\xbb\xbf" else data)
+    return json.loads(data)
 
 
 def dump_json_to_file(json_: dict, json_file: StrOrPath):
-    """serualize the provided dict to the file path"""
-    resolve_str_or_path(json_file).write_text(json.dumps(json_, **JSON_DUMP_ARGS))
+    """
+    serualize the provided dict to the file path
+    uses orjson when it is installed, otherwise falls back to the standard json module
+    note: orjson only supports 2-space indents so the output indentation differs between the two
+    """
+    json_file = resolve_str_or_path(json_file)
+    if orjson is not None:
+        json_file.write_bytes(orjson.dumps(json_, option=orjson.OPT_INDENT_2))
+    else:
+        # encode the chunks into a large write buffer so the output is neither built up as one string
+        #   nor written with many small writes
+        with json_file.open("wb", buffering=1 << 20) as f:
+            for chunk in json.JSONEncoder(**JSON_DUMP_ARGS).iterencode(json_):
+                f.write(chunk.encode("utf-8"))
+
+
+def write_bytes_to_file(data: bytes, file: StrOrPath):
+    """
+    write the provided bytes to the file path, replacing any existing content
+    uses the os-level calls directly to skip the buffered/text IO layers
+    """
+    fd = os.open(file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            # os.write can return before writing everything so continue from where it stopped
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)
+
+
+def dump_json_to_bytes(json_: dict) -> bytes:
+    """serialize the provided dict to bytes with the same formatting as dump_json_to_file"""
+    if orjson is not None:
+        return orjson.dumps(json_, option=orjson.OPT_INDENT_2)
+    return json.dumps(json_, **JSON_DUMP_ARGS).encode()
 
 
 def strip_strlist(strlist: List[Union[str, None]]) -> List[str]:
     """given a list of strings, return a list will all empty/blank items removed"""
-    return [item for item in strlist if item is not None and item != ""]
+    # None and "" are the only falsy values in a list of optional strings
+    return [item for item in strlist if item]
+
+
+CONDENSE_SPACES_RE = re.compile(r"\n{3,}")
 
 
 def condense_spaces(s: str) -> str:
     """replace all instance of >=3 newlines (\n) with a single double newline (\n\n)"""
-    return re.sub(r"\n{3,}", "\n\n", s, flags=re.MULTILINE)
+    return CONDENSE_SPACES_RE.sub("\n\n", s)
 
 
 def compare_set_overlap(set1: set, set2: set) -> float:
-    """given two sets, return the shared overlap as a decimal"""
-    shared = set1.intersection(set2)
-    total = set1.union(set2)
-    return len(shared) / len(total)
+    """given two sets, return the shared overlap as a decimal (0 if both are empty)"""
+    # only the size of the union is needed so derive it from the intersection rather than building it
+    shared = len(set1 & set2)
+    total = len(set1) + len(set2) - shared
+    return shared / total if total else 0.0
+
+
+UUID_RE = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
 
 
 def is_uuid(v) -> bool:
     """checks if the provided value is a valid UUID"""
+    # UUID() only accepts strings and the canonical form is always valid so both can be decided without it
+    if not isinstance(v, str):
+        return False
+    if UUID_RE.fullmatch(v):
+        return True
+    # other forms UUID() accepts (e.g. braces, urn prefix, no hyphens) still go through it
     try:
         UUID(v)
         return True
     # exception could be one of many so just catch them all
-    #   e.g. UUID("abc") is a ValueError but UUID(123) is an AttributeError
+    #   e.g. UUID("abc") is a ValueError
     except Exception:
         return False
 
 
 def path_is_writable(path: StrOrPath) -> bool:
-    """checks if the provided path is writable"""
-    return os.access(resolve_str_or_path(path), os.W_OK)
+    """
+    checks if the provided path is writable
+    paths that do not exist yet are writable if their parent directory is
+    """
+    path = resolve_str_or_path(path)
+    if os.access(path, os.W_OK):
+        return True
+    return not path.exists() and os.access(path.parent, os.W_OK)